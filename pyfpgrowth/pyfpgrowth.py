@@ -1,3 +1,5 @@
+import bisect
+import collections
 import itertools
 
 
@@ -6,6 +8,8 @@ class FPNode(object):
     A node in the FP tree.
     """
 
+    __slots__ = ('value', 'count', 'parent', 'link', 'children')
+
     def __init__(self, value, count, parent):
         """
         Create the node.
@@ -14,34 +18,26 @@ class FPNode(object):
         self.count = count
         self.parent = parent
         self.link = None
-        self.children = []
+        self.children = {}
 
     def has_child(self, value):
         """
         Check if node has a particular child node.
         """
-        for node in self.children:
-            if node.value == value:
-                return True
-
-        return False
+        return value in self.children
 
     def get_child(self, value):
         """
         Return a child node with a particular value.
         """
-        for node in self.children:
-            if node.value == value:
-                return node
-
-        return None
+        return self.children.get(value)
 
     def add_child(self, value):
         """
         Add a node as a child node.
         """
         child = FPNode(value, 1, self)
-        self.children.append(child)
+        self.children[value] = child
         return child
 
 
@@ -50,35 +46,46 @@ class FPTree(object):
     A frequent pattern tree.
     """
 
-    def __init__(self, transactions, threshold, root_value, root_count):
+    def __init__(self, transactions, threshold, root_value, root_count,
+                 weighted=False, frequent=None):
         """
-        Initialize the tree.
+        Initialize the tree. If weighted is True, transactions
+        are (items, count) pairs rather than plain item lists.
+        If frequent is given, it is taken as the items already
+        known to be over the threshold, with their counts.
         """
-        self.frequent = self.find_frequent_items(transactions, threshold)
+        if frequent is None:
+            frequent = self.find_frequent_items(
+                transactions, threshold, weighted)
+        self.frequent = frequent
+        if not weighted:
+            transactions = [(transaction, 1) for transaction in transactions]
+
         self.headers = self.build_header_table(self.frequent)
         self.root = self.build_fptree(
             transactions, root_value,
             root_count, self.frequent, self.headers)
 
     @staticmethod
-    def find_frequent_items(transactions, threshold):
+    def find_frequent_items(transactions, threshold, weighted=False):
         """
         Create a dictionary of items with occurrences above the threshold.
         """
-        items = {}
-
-        for transaction in transactions:
-            for item in transaction:
-                if item in items:
-                    items[item] += 1
-                else:
-                    items[item] = 1
-
-        for key in list(items.keys()):
-            if items[key] < threshold:
-                del items[key]
+        if weighted:
+            items = {}
+            for transaction, count in transactions:
+                for item in transaction:
+                    if item in items:
+                        items[item] += count
+                    else:
+                        items[item] = count
+        else:
+            # Plain transactions can be counted in a single C-level pass.
+            items = collections.Counter(
+                itertools.chain.from_iterable(transactions))
 
-        return items
+        return dict((item, count) for item, count in items.items()
+                    if count >= threshold)
 
     @staticmethod
     def build_header_table(frequent):
@@ -97,53 +104,65 @@ class FPTree(object):
         Build the FP tree and return the root node.
         """
         root = FPNode(root_value, root_count, None)
-
-        for transaction in transactions:
-            sorted_items = [x for x in transaction if x in frequent]
-            sorted_items.sort(key=lambda x: frequent[x], reverse=True)
-            if len(sorted_items) > 0:
-                self.insert_tree(sorted_items, root, headers)
+        tails = self.build_header_table(frequent)
+
+        # Give each item its position in descending frequency
+        # order, so transactions are sorted as plain integers
+        # and mapped back through the ordered list. Ties fall
+        # in whatever order the frequent dict iterates, which
+        # need not be first-seen order before Python 3.7, but
+        # ordered is built once per tree, so every transaction
+        # sees the same order and items need not be comparable.
+        ordered = sorted(frequent, key=lambda x: -frequent[x])
+        rank = dict((item, i) for i, item in enumerate(ordered))
+
+        for transaction, count in transactions:
+            ranks = [rank[x] for x in transaction if x in rank]
+            if len(ranks) > 0:
+                ranks.sort()
+                sorted_items = [ordered[i] for i in ranks]
+                self.insert_tree(sorted_items, root, headers, tails, count)
 
         return root
 
-    def insert_tree(self, items, node, headers):
+    def insert_tree(self, items, node, headers, tails, count=1):
         """
-        Recursively grow FP tree.
+        Grow FP tree along the path given by items, adding
+        count to every node on it. Tails holds the last node
+        in each header's link chain so new nodes can be
+        linked without a walk.
         """
-        first = items[0]
-        child = node.get_child(first)
-        if child is not None:
-            child.count += 1
-        else:
-            # Add new child.
-            child = node.add_child(first)
-
-            # Link it to header structure.
-            if headers[first] is None:
-                headers[first] = child
+        # This is the innermost loop of tree construction, so
+        # the children dict is used directly rather than going
+        # through get_child/add_child for every item.
+        for item in items:
+            children = node.children
+            child = children.get(item)
+            if child is not None:
+                child.count += count
             else:
-                current = headers[first]
-                while current.link is not None:
-                    current = current.link
-                current.link = child
+                # Add new child.
+                child = FPNode(item, count, node)
+                children[item] = child
+
+                # Link it to header structure.
+                if headers[item] is None:
+                    headers[item] = child
+                else:
+                    tails[item].link = child
+                tails[item] = child
 
-        # Call function recursively.
-        remaining_items = items[1:]
-        if len(remaining_items) > 0:
-            self.insert_tree(remaining_items, child, headers)
+            node = child
 
     def tree_has_single_path(self, node):
         """
         If there is a single path in the tree,
         return True, else return False.
         """
-        num_children = len(node.children)
-        if num_children > 1:
-            return False
-        elif num_children == 0:
-            return True
-        else:
-            return True and self.tree_has_single_path(node.children[0])
+        while len(node.children) == 1:
+            node = next(iter(node.children.values()))
+
+        return len(node.children) == 0
 
     def mine_patterns(self, threshold):
         """
@@ -162,10 +181,12 @@ class FPTree(object):
         suffix = self.root.value
 
         if suffix is not None:
-            # We are in a conditional tree.
+            # We are in a conditional tree. Keys are already
+            # sorted, so the suffix is spliced in at its place.
             new_patterns = {}
             for key in patterns.keys():
-                new_patterns[tuple(sorted(list(key) + [suffix]))] = patterns[key]
+                i = bisect.bisect_left(key, suffix)
+                new_patterns[key[:i] + (suffix,) + key[i:]] = patterns[key]
 
             return new_patterns
 
@@ -176,21 +197,40 @@ class FPTree(object):
         Generate a list of patterns with support counts.
         """
         patterns = {}
-        items = self.frequent.keys()
+
+        # Walk the single path. Counts never increase on the
+        # way down, so the support of any set of path items is
+        # the count of the deepest one.
+        path = []
+        node = self.root
+        while len(node.children) > 0:
+            node = next(iter(node.children.values()))
+            path.append((node.value, node.count))
 
         # If we are in a conditional tree,
         # the suffix is a pattern on its own.
         if self.root.value is None:
-            suffix_value = []
+            suffix_value = ()
         else:
-            suffix_value = [self.root.value]
-            patterns[tuple(suffix_value)] = self.root.count
-
-        for i in range(1, len(items) + 1):
-            for subset in itertools.combinations(items, i):
-                pattern = tuple(sorted(list(subset) + suffix_value))
-                patterns[pattern] = \
-                    min([self.frequent[x] for x in subset])
+            suffix_value = (self.root.value,)
+            patterns[suffix_value] = self.root.count
+
+        # Build patterns one size at a time, extending each
+        # pattern of the previous size with every deeper path
+        # item. Patterns come out in the same order as
+        # itertools.combinations, and each one stays sorted by
+        # splicing the new item in rather than re-sorting.
+        level = [(-1, suffix_value)]
+        for _ in range(len(path)):
+            next_level = []
+            for last, prefix in level:
+                for i in range(last + 1, len(path)):
+                    value, count = path[i]
+                    j = bisect.bisect_left(prefix, value)
+                    pattern = prefix[:j] + (value,) + prefix[j:]
+                    patterns[pattern] = count
+                    next_level.append((i, pattern))
+            level = next_level
 
         return patterns
 
@@ -204,35 +244,50 @@ class FPTree(object):
 
         # Get items in tree in reverse order of occurrences.
         for item in mining_order:
-            suffixes = []
             conditional_tree_input = []
-            node = self.headers[item]
-
-            # Follow node links to get a list of
-            # all occurrences of a certain item.
-            while node is not None:
-                suffixes.append(node)
-                node = node.link
-
-            # For each occurrence of the item, 
-            # trace the path back to the root node.
-            for suffix in suffixes:
-                frequency = suffix.count
+            counts = {}
+            root = self.root
+            suffix = self.headers[item]
+
+            # Follow node links to visit all occurrences of a
+            # certain item, and for each one trace the path back
+            # to the root node, counting the items on the way.
+            # Comparing against the root saves an attribute
+            # lookup per step of the walk.
+            while suffix is not None:
                 path = []
+                frequency = suffix.count
                 parent = suffix.parent
 
-                while parent.parent is not None:
-                    path.append(parent.value)
+                while parent is not root:
+                    value = parent.value
+                    path.append(value)
+                    if value in counts:
+                        counts[value] += frequency
+                    else:
+                        counts[value] = frequency
                     parent = parent.parent
 
-                for i in range(frequency):
-                    conditional_tree_input.append(path)
+                # An empty path adds nothing to the subtree.
+                if len(path) > 0:
+                    conditional_tree_input.append((path, frequency))
 
-            # Now we have the input for a subtree,
-            # so construct it and grab the patterns.
-            subtree = FPTree(conditional_tree_input, threshold,
-                             item, self.frequent[item])
-            subtree_patterns = subtree.mine_patterns(threshold)
+                suffix = suffix.link
+
+            frequent = dict((x, count) for x, count in counts.items()
+                            if count >= threshold)
+
+            if len(frequent) == 0:
+                # The conditional tree would hold only its root,
+                # so the item is the only pattern it can give.
+                subtree_patterns = {(item,): self.frequent[item]}
+            else:
+                # Now we have the input for a subtree,
+                # so construct it and grab the patterns.
+                subtree = FPTree(conditional_tree_input, threshold,
+                                 item, self.frequent[item],
+                                 weighted=True, frequent=frequent)
+                subtree_patterns = subtree.mine_patterns(threshold)
 
             # Insert subtree patterns into main patterns dictionary.
             for pattern in subtree_patterns.keys():
@@ -253,20 +308,42 @@ def find_frequent_patterns(transactions, support_threshold):
     return tree.mine_patterns(support_threshold)
 
 
-def generate_association_rules(patterns, confidence_threshold):
+def generate_association_rules(patterns, confidence_threshold,
+                               max_consequent_length=None):
     """
     Given a set of frequent itemsets, return a dict
     of association rules in the form
     {(left): ((right), confidence)}
+    Consequents longer than max_consequent_length
+    are not considered, if it is given.
     """
     rules = {}
     for itemset in patterns.keys():
         upper_support = patterns[itemset]
 
-        for i in range(1, len(itemset)):
-            for antecedent in itertools.combinations(itemset, i):
-                antecedent = tuple(sorted(antecedent))
-                consequent = tuple(sorted(set(itemset) - set(antecedent)))
+        # Combinations of a sorted itemset come out sorted,
+        # so antecedents and consequents need no sorting.
+        sorted_itemset = tuple(sorted(itemset))
+        longest = len(itemset) - 1
+        if max_consequent_length is not None:
+            longest = min(longest, max_consequent_length)
+
+        # Moving an item from the antecedent to the consequent
+        # can only lower confidence, so a consequent is skipped
+        # if any consequent one item shorter has already failed.
+        failed = set()
+
+        for i in range(1, longest + 1):
+            for consequent in itertools.combinations(sorted_itemset, i):
+                if failed and any(
+                        shorter in failed for shorter in
+                        itertools.combinations(consequent, i - 1)):
+                    failed.add(consequent)
+                    continue
+
+                consequent_set = frozenset(consequent)
+                antecedent = tuple(x for x in sorted_itemset
+                                   if x not in consequent_set)
 
                 if antecedent in patterns:
                     lower_support = patterns[antecedent]
@@ -274,5 +351,7 @@ def generate_association_rules(patterns, confidence_threshold):
 
                     if confidence >= confidence_threshold:
                         rules[antecedent] = (consequent, confidence)
+                    else:
+                        failed.add(consequent)
 
     return rules
@@ -8,9 +8,27 @@ test_pyfpgrowth
 Tests for pyfpgrowth` module.
 """
 
+import os
 import unittest
-from pyfpgrowth import *
-from pyfpgrowth.pyfpgrowth import FPNode, FPTree
+from pyfpgrowth.pyfpgrowth import (FPNode, FPTree, find_frequent_patterns,
+                                   generate_association_rules)
+
+# Example transactions from Han et al., shared by the tests.
+# The library only iterates over them, so they are immutable.
+TRANSACTIONS = ((1, 2, 5),
+                (2, 4),
+                (2, 3),
+                (1, 2, 4),
+                (1, 3),
+                (2, 3),
+                (1, 3),
+                (1, 2, 3, 5),
+                (1, 2, 3))
+
+# Patterns in TRANSACTIONS with a support of at least 2.
+EXPECTED_PATTERNS = {(1, 2): 4, (1, 2, 3): 2, (1, 3): 4, (1,): 6, (2,): 7,
+                     (2, 4): 2, (1, 5): 2, (5,): 2, (2, 3): 4, (2, 5): 2,
+                     (4,): 2, (1, 2, 5): 2}
 
 
 class FPNodeTests(unittest.TestCase):
@@ -29,25 +47,25 @@ class FPNodeTests(unittest.TestCase):
         """
         Create a root node and test that it has no parent.
         """
-        self.assertEquals(self.node.has_child(3), False)
-        self.assertEquals(self.node.has_child(2), True)
+        self.assertFalse(self.node.has_child(3))
+        self.assertTrue(self.node.has_child(2))
 
     def test_get_child(self):
         """
         Test that getChild() returns a node for a valid value
         and None for an invalid value.
         """
-        self.assertNotEquals(self.node.get_child(2), None)
-        self.assertEquals(self.node.get_child(5), None)
+        self.assertIsNotNone(self.node.get_child(2))
+        self.assertIsNone(self.node.get_child(5))
 
     def test_add_child(self):
         """
         Test that addChild() successfully adds a child node.
         """
-        self.assertEquals(self.node.get_child(3), None)
+        self.assertIsNone(self.node.get_child(3))
         self.node.add_child(3)
-        self.assertNotEquals(self.node.get_child(3), None)
-        self.assertEquals(type(self.node.get_child(3)), type(self.node))
+        self.assertIsNotNone(self.node.get_child(3))
+        self.assertEqual(type(self.node.get_child(3)), type(self.node))
 
 
 class FPTreeTests(unittest.TestCase):
@@ -59,13 +77,40 @@ class FPTreeTests(unittest.TestCase):
         """
         Test that buildHeaderTable() returns a dict with all None values.
         """
-        tree = FPTree([], 3, None, None)
         frequent = {1: 12, 2: 43, 6: 32}
-        headers = tree.build_header_table(frequent)
+        headers = FPTree.build_header_table(frequent)
 
-        self.assertEquals(headers[1], None)
-        self.assertEquals(headers[2], None)
-        self.assertEquals(headers[6], None)
+        self.assertIsNone(headers[1])
+        self.assertIsNone(headers[2])
+        self.assertIsNone(headers[6])
+
+    def test_insert_tree_links_headers(self):
+        """
+        Test that insert_tree() chains every node for an item
+        onto its header in insertion order.
+        """
+        tree = FPTree([[1, 2], [2, 3], [1, 3]], 1, None, None)
+
+        values = []
+        node = tree.headers[3]
+        while node is not None:
+            values.append(node.parent.value)
+            node = node.link
+
+        self.assertEqual(values, [2, 1])
+
+    def test_weighted_transactions(self):
+        """
+        Test that weighted transactions add their count to
+        both the item frequencies and the tree nodes.
+        """
+        tree = FPTree([([1, 2], 3), ([1], 2)], 2, None, None, weighted=True)
+
+        self.assertDictEqual(tree.frequent, {1: 5, 2: 3})
+        node = tree.root.get_child(1)
+        self.assertEqual(node.count, 5)
+        self.assertEqual(node.get_child(2).count, 3)
+        self.assertEqual(len(node.get_child(2).children), 0)
 
 
 class FPGrowthTests(unittest.TestCase):
@@ -73,30 +118,108 @@ class FPGrowthTests(unittest.TestCase):
     Tests everything together.
     """
     support_threshold = 2
-    transactions = [[1, 2, 5],
-                    [2, 4],
-                    [2, 3],
-                    [1, 2, 4],
-                    [1, 3],
-                    [2, 3],
-                    [1, 3],
-                    [1, 2, 3, 5],
-                    [1, 2, 3]]
+    transactions = TRANSACTIONS
 
-    def test_find_frequent_patterns(self):
-        patterns = find_frequent_patterns(self.transactions, self.support_threshold)
+    @classmethod
+    def setUpClass(cls):
+        """
+        Build and mine the transactions once for all the
+        tests that only read the resulting tree and patterns.
+        """
+        cls.tree = FPTree(cls.transactions, cls.support_threshold,
+                          None, None)
+        cls.patterns = find_frequent_patterns(cls.transactions,
+                                              cls.support_threshold)
 
-        expected = {(1, 2): 4, (1, 2, 3): 2, (1, 3): 4, (1,): 6, (2,): 7, (2, 4): 2,
-                    (1, 5): 2, (5,): 2, (2, 3): 4, (2, 5): 2, (4,): 2, (1, 2, 5): 2}
-        self.assertEqual(patterns, expected)
+    def test_find_frequent_patterns(self):
+        """
+        Test that find_frequent_patterns() and mining the
+        tree directly give the same patterns.
+        """
+        self.assertDictEqual(self.patterns, EXPECTED_PATTERNS)
+        self.assertDictEqual(self.tree.mine_patterns(self.support_threshold),
+                             EXPECTED_PATTERNS)
 
     def test_generate_association_rules(self):
-        patterns = find_frequent_patterns(self.transactions, self.support_threshold)
-        rules = generate_association_rules(patterns, 0.7)
+        rules = generate_association_rules(self.patterns, 0.7)
 
         expected = {(1, 5): ((2,), 1.0), (5,): ((1, 2), 1.0),
                     (2, 5): ((1,), 1.0), (4,): ((2,), 1.0)}
-        self.assertEqual(rules, expected)
+        self.assertDictEqual(rules, expected)
+
+    def test_generate_association_rules_max_consequent_length(self):
+        rules = generate_association_rules(self.patterns, 0.7, 1)
+
+        expected = {(1, 5): ((2,), 1.0), (5,): ((2,), 1.0),
+                    (2, 5): ((1,), 1.0), (4,): ((2,), 1.0)}
+        self.assertDictEqual(rules, expected)
+
+    def test_find_frequent_patterns_with_tied_counts(self):
+        """
+        Items with equal counts must be ordered the same way
+        in every transaction, whatever order they arrive in.
+        """
+        patterns = find_frequent_patterns([[4, 1], [1, 4], [4, 1]], 2)
+
+        expected = {(1,): 3, (4,): 3, (1, 4): 3}
+        self.assertDictEqual(patterns, expected)
+
+    def test_find_frequent_patterns_with_incomparable_items(self):
+        """
+        Items that never share a transaction need not be
+        comparable with each other.
+        """
+        patterns = find_frequent_patterns([['a'], [1]], 1)
+        self.assertDictEqual(patterns, {('a',): 1, (1,): 1})
+
+        patterns = find_frequent_patterns([[('x', 1)], [None]], 1)
+        self.assertDictEqual(patterns, {(('x', 1),): 1, (None,): 1})
+
+
+@unittest.skipUnless(os.environ.get('PYFPGROWTH_BENCH') == '1',
+                     'set PYFPGROWTH_BENCH=1 to run the large dataset tests')
+class BelgianRetailTests(unittest.TestCase):
+    """
+    Tests against the Belgian retail basket dataset, which is
+    large enough for changes in performance to show up.
+    """
+    support_threshold = 100
+
+    @classmethod
+    def setUpClass(cls):
+        """
+        Load the baskets, one transaction of item IDs per line.
+        """
+        path = os.path.join(os.path.dirname(__file__),
+                            'belgian_retail_baskets.dat')
+        with open(path) as data:
+            cls.transactions = [[int(x) for x in line.split()]
+                                for line in data]
+
+    def test_find_frequent_patterns(self):
+        """
+        Test that the patterns found have their true support.
+        """
+        patterns = find_frequent_patterns(self.transactions,
+                                          self.support_threshold)
+        self.assertTrue(len(patterns) > 0)
+
+        counts = {}
+        for transaction in self.transactions:
+            for item in transaction:
+                counts[item] = counts.get(item, 0) + 1
+        most_common = max(counts, key=counts.get)
+        self.assertEqual(patterns[(most_common,)], counts[most_common])
+
+        # Recounting every pattern by brute force is slow,
+        # so check the longest ones, which are the hardest.
+        baskets = [set(transaction) for transaction in self.transactions]
+        longest = sorted(patterns, key=len, reverse=True)[:20]
+        for pattern in longest:
+            support = sum(1 for basket in baskets
+                          if basket.issuperset(pattern))
+            self.assertEqual(patterns[pattern], support)
+            self.assertTrue(support >= self.support_threshold)
 
 
 if __name__ == '__main__':